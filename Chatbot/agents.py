@@ -2,21 +2,15 @@
 Implementation of the agents for the real estate chatbot.
 Contains the logic for the property issue detection agent, tenancy FAQ, and router.
 """
-from typing import Dict, List, Any, Optional, Tuple
-import base64
-import os
+from typing import Dict, Any
+import asyncio
+import re
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
-from PIL import Image
+from PIL import Image, ImageOps
 
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain.tools import Tool
-
-# Import Google's generative AI client
-import google.generativeai as genai
-from google.generativeai import types
 
 import config
 from schemas import PropertyIssueReport, TenancyFAQResponse
@@ -112,6 +106,17 @@ You **MUST** respond using the structured output format defined by the `TenancyF
 Remember to search for current information before answering questions about specific tenancy laws or regulations, especially when a location is specified.
 """
 
+# Tenancy prompt with search instructions, built once so every request sends a
+# byte-identical prefix that provider-side prompt caching can match
+TENANCY_SEARCH_PROMPT = f"""
+{TENANCY_FAQ_SYSTEM_PROMPT}
+
+Before answering:
+1. Perform a web search to find current information about this tenancy question
+2. If location-specific information is available, prioritize that
+3. Cite your sources in the legal_references field
+"""
+
 ROUTER_SYSTEM_PROMPT = """
 You are a routing agent for a real estate assistance system. Your job is to analyze the user query and determine which specialized agent should handle it.
 
@@ -128,7 +133,88 @@ If the query is unclear or doesn't fit either category, respond with "UNCLEAR_IS
 Respond only with one of these exact labels: "PROPERTY_ISSUE", "TENANCY_FAQ", or "UNCLEAR_ISSUE".
 """
 
-def run_agent_1(state: Dict[str, Any]) -> Dict[str, Any]:
+# Keyword fast paths for the router, compiled once. Each keyword must start at a
+# word boundary, so inflections like "tenants" match but "current" does not hit "rent".
+TENANCY_KEYWORDS_RE = re.compile(
+    r"\b(?:tenant|landlord|rent|lease|deposit|eviction|contract|tenancy|agreement|notice|"
+    r"vacate|property manager|rental|evict|sublet)",
+    re.IGNORECASE
+)
+PROPERTY_ISSUE_KEYWORDS_RE = re.compile(
+    r"\b(?:mold|leak|crack|broken|damage|damp|water|wall|ceiling|floor|roof|plumbing|"
+    r"electrical|fixture|appliance|heating|cooling|hvac|pest)",
+    re.IGNORECASE
+)
+
+# System messages are immutable, so build them once and reuse them on every call
+PROPERTY_ISSUE_SYSTEM_MESSAGE = SystemMessage(content=PROPERTY_ISSUE_SYSTEM_PROMPT)
+TENANCY_SEARCH_SYSTEM_MESSAGE = SystemMessage(content=TENANCY_SEARCH_PROMPT)
+ROUTER_SYSTEM_MESSAGE = SystemMessage(content=ROUTER_SYSTEM_PROMPT)
+
+@lru_cache(maxsize=None)
+def get_property_issue_llm():
+    """
+    Returns the flash LLM bound to the PropertyIssueReport schema.
+    Cached so the schema conversion for structured output happens once per process.
+    """
+    return config.get_gemini_flash_llm().with_structured_output(PropertyIssueReport)
+
+@lru_cache(maxsize=None)
+def get_tenancy_faq_llm():
+    """
+    Returns the flash LLM bound to the TenancyFAQResponse schema.
+    Cached like get_property_issue_llm().
+    """
+    return config.get_gemini_flash_llm().with_structured_output(TenancyFAQResponse)
+
+# Longest edge, in pixels, of images sent to the vision model; larger images add
+# upload time and vision tokens without adding detail Gemini can use
+MAX_VISION_IMAGE_SIDE = 1568
+
+# EXIF tag holding the camera orientation of a photo
+EXIF_ORIENTATION_TAG = 0x0112
+
+def downscale_for_vision(image_data: bytes) -> bytes:
+    """
+    Downscales an image so neither side exceeds MAX_VISION_IMAGE_SIDE.
+    The EXIF orientation is applied first, since the re-encoded JPEG carries no EXIF.
+    
+    Args:
+        image_data: The binary image data
+        
+    Returns:
+        JPEG-encoded bytes of the resized image, or the original bytes if it is already small enough and upright
+    """
+    img = Image.open(BytesIO(image_data))
+    upright = img.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+    if max(img.size) <= MAX_VISION_IMAGE_SIDE and upright:
+        return image_data
+    
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((MAX_VISION_IMAGE_SIDE, MAX_VISION_IMAGE_SIDE), Image.LANCZOS)
+    buf = BytesIO()
+    img.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True)
+    return buf.getvalue()
+
+def detect_image_mime(image_data: bytes) -> str:
+    """
+    Detects an image's MIME type from its magic bytes.
+    
+    Args:
+        image_data: The binary image data
+        
+    Returns:
+        The MIME type, defaulting to image/jpeg when the format is not recognized
+    """
+    if image_data.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_data.startswith(b"GIF8"):
+        return "image/gif"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+async def run_agent_1(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Agent 1: Property Issue Detection Agent
     
@@ -166,14 +252,15 @@ def run_agent_1(state: Dict[str, Any]) -> Dict[str, Any]:
             "text": query if query else "Please analyze this image for property issues."
         })
         
-        # Add image if available
+        # Add image if available, passing the raw bytes as inline data
+        # so no base64 data URI has to be built and re-parsed
         if image_data:
-            # Convert bytes to base64 for Gemini
-            encoded_image = base64.b64encode(image_data).decode("utf-8")
-            image_uri = f"data:image/jpeg;base64,{encoded_image}"
+            # Pillow work is CPU-bound; keep it off the shared event loop
+            image_data = await asyncio.to_thread(downscale_for_vision, image_data)
             human_message_content.append({
-                "type": "image_url",
-                "image_url": image_uri
+                "type": "media",
+                "mime_type": detect_image_mime(image_data),
+                "data": image_data
             })
         
         # Extract additional context if available
@@ -184,13 +271,10 @@ def run_agent_1(state: Dict[str, Any]) -> Dict[str, Any]:
         # Create multimodal input for Gemini
         human_message = HumanMessage(content=human_message_content)
         
-        # Initialize the LLM
-        llm = config.get_gemini_flash_llm()
-        
         # Run inference with structured output
-        result = llm.with_structured_output(PropertyIssueReport).invoke(
+        result = await get_property_issue_llm().ainvoke(
             [
-                SystemMessage(content=PROPERTY_ISSUE_SYSTEM_PROMPT),
+                PROPERTY_ISSUE_SYSTEM_MESSAGE,
                 human_message
             ]
         )
@@ -209,12 +293,12 @@ def run_agent_1(state: Dict[str, Any]) -> Dict[str, Any]:
             "sender": "agent_1"
         }
 
-def run_agent_2(state: Dict[str, Any]) -> Dict[str, Any]:
+async def run_agent_2(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Agent 2: Tenancy FAQ Agent
     
     Answers questions about tenancy laws and regulations with grounding via Google Search.
-    Uses direct Google genai client with Google Search tool and returns structured output.
+    Uses the shared Gemini Flash client from config and returns structured output.
     
     Args:
         state: The current state dictionary containing:
@@ -241,27 +325,14 @@ def run_agent_2(state: Dict[str, Any]) -> Dict[str, Any]:
         else:
             full_query = query
             
-        # Use the LangChain wrapper for Google Gemini with flash model instead of pro
-        llm = config.get_gemini_flash_llm()
-        
-        # Create a prompt that includes instructions for web search
-        search_prompt = f"""
-{TENANCY_FAQ_SYSTEM_PROMPT}
-
-Before answering:
-1. Perform a web search to find current information about this tenancy question
-2. If location-specific information is available, prioritize that
-3. Cite your sources in the legal_references field
-"""
-        
         # Create messages for the LLM
         messages = [
-            SystemMessage(content=search_prompt),
+            TENANCY_SEARCH_SYSTEM_MESSAGE,
             HumanMessage(content=full_query)
         ]
         
         # Run inference with structured output
-        result = llm.with_structured_output(TenancyFAQResponse).invoke(messages)
+        result = await get_tenancy_faq_llm().ainvoke(messages)
         
         # Return the structured output directly to be handled by the UI
         return {
@@ -277,7 +348,44 @@ Before answering:
             "sender": "agent_2"
         }
 
-def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
+# Router decisions keyed by normalized query, so exact repeats skip the LLM call
+ROUTER_CACHE_SIZE = 256
+_router_decision_cache: "OrderedDict[str, str]" = OrderedDict()
+
+async def classify_query(query: str) -> str:
+    """
+    Classifies a query as PROPERTY_ISSUE, TENANCY_FAQ or UNCLEAR_ISSUE using the router LLM.
+    
+    The cache key is the query normalized for case and whitespace, so exact repeats
+    are answered from an in-process LRU cache instead of another LLM round-trip.
+    The router itself always sees the query as written.
+    
+    Args:
+        query: The user's text query
+        
+    Returns:
+        The router's raw decision label
+    """
+    normalized_query = " ".join(query.lower().split())
+    if normalized_query in _router_decision_cache:
+        _router_decision_cache.move_to_end(normalized_query)
+        return _router_decision_cache[normalized_query]
+    
+    router_response = await config.get_gemini_flash_llm().ainvoke(
+        [
+            ROUTER_SYSTEM_MESSAGE,
+            HumanMessage(content=query)
+        ]
+    )
+    
+    router_decision = router_response.content.strip()
+    _router_decision_cache[normalized_query] = router_decision
+    if len(_router_decision_cache) > ROUTER_CACHE_SIZE:
+        _router_decision_cache.popitem(last=False)
+    
+    return router_decision
+
+async def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Router to determine which agent should handle the query.
     
@@ -320,11 +428,6 @@ def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
                     "next": "agent_2"
                 }
         
-        # Check for explicit tenancy keywords before using LLM
-        tenancy_keywords = ["tenant", "landlord", "rent", "lease", "deposit", "eviction", 
-                           "contract", "tenancy", "agreement", "notice", "vacate",
-                           "property manager", "rental", "evict", "sublet"]
-        
         # Check if query contains "[TENANCY QUESTION]" tag
         if "[TENANCY QUESTION]" in query:
             return {
@@ -333,24 +436,22 @@ def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
             }
         
         # Check for common tenancy question patterns
-        if "how much notice" in query.lower() and ("vacate" in query.lower() or "leave" in query.lower() or "move out" in query.lower()):
+        query_lower = query.lower()
+        if "how much notice" in query_lower and ("vacate" in query_lower or "leave" in query_lower or "move out" in query_lower):
             return {
                 **state,
                 "next": "agent_2"
             }
-            
-        if any(keyword in query.lower() for keyword in tenancy_keywords):
+        
+        # Check for explicit tenancy keywords before using LLM
+        if TENANCY_KEYWORDS_RE.search(query):
             return {
                 **state,
                 "next": "agent_2"
             }
         
         # Property-related keywords (if not already routed to tenancy)
-        property_issue_keywords = ["mold", "leak", "crack", "broken", "damage", "damp", "water", 
-                                 "wall", "ceiling", "floor", "roof", "plumbing", "electrical", 
-                                 "fixture", "appliance", "heating", "cooling", "hvac", "pest"]
-        
-        if any(keyword in query.lower() for keyword in property_issue_keywords):
+        if PROPERTY_ISSUE_KEYWORDS_RE.search(query):
             if not image_data:
                 return {
                     **state,
@@ -364,17 +465,7 @@ def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
                 }
         
         # If no clear keyword match, use the LLM for more nuanced routing
-        llm = config.get_gemini_flash_llm()
-        
-        # Get routing decision
-        router_response = llm.invoke(
-            [
-                SystemMessage(content=ROUTER_SYSTEM_PROMPT),
-                HumanMessage(content=query)
-            ]
-        )
-        
-        router_decision = router_response.content.strip()
+        router_decision = await classify_query(query)
         
         if "PROPERTY_ISSUE" in router_decision:
             if not image_data:
@@ -407,7 +498,7 @@ def route_query(state: Dict[str, Any]) -> Dict[str, Any]:
             "response": f"I encountered an error routing your query: {str(e)}. Could you please rephrase your question?"
         }
 
-def ask_clarification(state: Dict[str, Any]) -> Dict[str, Any]:
+async def ask_clarification(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Asks for clarification when query is unclear.
     
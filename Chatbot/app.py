@@ -3,26 +3,40 @@ Streamlit application for the Real Estate Chatbot.
 Provides a user interface for interacting with the multi-agent system.
 """
 import streamlit as st
-from PIL import Image
-import io
-from typing import Dict, List, Any
-import base64
+import asyncio
 import datetime
+import hashlib
+import html
+import io
+import json
 import logging
-import re
-
-# Configure logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from pathlib import Path
+
+import session_store
+
+# Configure logging; set APP_LOG_LEVEL=DEBUG to trace requests through the graph
+log_level = os.getenv("APP_LOG_LEVEL", "INFO").upper()
+# getLevelName() maps known level names to their number (getLevelNamesMapping() needs 3.11)
+valid_log_level = isinstance(logging.getLevelName(log_level), int)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=log_level if valid_log_level else logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler()
     ]
 )
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
+if not valid_log_level:
+    logger.warning(f"Unknown APP_LOG_LEVEL {log_level!r}, falling back to INFO")
 
-from graph import compiled_graph
-from schemas import PropertyIssueReport, TenancyFAQResponse
+# Year shown in the footer
+_CURRENT_YEAR = datetime.datetime.now().year
 
 # Set page configuration
 st.set_page_config(
@@ -31,724 +45,728 @@ st.set_page_config(
     layout="wide"
 )
 
-# Updated premium enterprise SaaS dark theme with 8px grid system
-st.markdown("""
-<style>
-    /* Base Variables - 8px Grid System with Premium Color Palette */
-    :root {
-        /* Primary Colors */
-        --primary-dark: #0F172A;
-        --primary-main: #1E293B;
-        --primary-light: #334155;
-        --primary-accent: #0D9488;
+@st.cache_resource
+def get_graph():
+    """
+    Returns the compiled LangGraph, built once per process and shared across
+    sessions and reruns. Imported lazily so UI-only reruns never load LangChain.
+    """
+    from graph import create_graph
+    return create_graph()
+
+@st.cache_resource
+def load_css():
+    """
+    Returns the app stylesheet, read from disk once per process.
+    """
+    return (Path(__file__).parent / "static" / "styles.css").read_text(encoding="utf-8")
+
+@st.cache_data(show_spinner=False)
+def build_context_str(location, property_type, occupancy, property_age):
+    """
+    Formats the sidebar property details into a context string for the query.
+    
+    Args:
+        location: The user-provided location, if any
+        property_type: The selected property type
+        occupancy: The selected occupancy status
+        property_age: The property age in years
         
-        /* Secondary Colors */
-        --secondary-warm: #F59E0B;
-        --secondary-slate: #64748B;
-        --secondary-slate-light: #94A3B8;
+    Returns:
+        str: The formatted context, or an empty string if no details apply
+    """
+    parts = []
+    if location:
+        parts.append(f" Location: {location}.")
+    if property_type != "Other":
+        parts.append(f" Property type: {property_type}.")
+    if occupancy != "Not applicable":
+        parts.append(f" Occupancy: {occupancy}.")
+    if property_age > 0:
+        parts.append(f" Property age: {property_age} years.")
+    return "".join(parts)
+
+# Number of user/assistant turns passed to the graph as chat history
+MAX_HISTORY_TURNS = 10
+
+# Number of most recent chat messages drawn on every rerun
+MAX_VISIBLE_MESSAGES = 20
+
+# Number of chat messages kept in session state; older ones are archived to disk
+MAX_SESSION_MESSAGES = 100
+
+def append_message(message):
+    """
+    Appends a message to the chat history. Once the history exceeds
+    MAX_SESSION_MESSAGES, the oldest messages are moved to the session archive.
+    
+    Args:
+        message: The message dictionary to append
+    """
+    messages = st.session_state.messages
+    messages.append(message)
+    
+    overflow = len(messages) - MAX_SESSION_MESSAGES
+    if overflow > 0:
+        try:
+            session_store.archive_messages(st.session_state.session_id, messages[:overflow])
+        except OSError as e:
+            logger.warning(f"Could not archive messages: {str(e)}")
+        del messages[:overflow]
+
+def build_graph_history(messages):
+    """
+    Returns the recent slice of the chat history to pass to the graph.
+    
+    Args:
+        messages: The full list of chat messages kept in session state
         
-        /* State Colors */
-        --success: #10B981;
-        --warning: #F59E0B;
-        --error: #EF4444;
-        --info: #3B82F6;
+    Returns:
+        list: At most MAX_HISTORY_TURNS user/assistant pairs, as role/content dicts only
+    """
+    return [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in messages[-2 * MAX_HISTORY_TURNS:]
+    ]
+
+def extract_context_from_history(messages):
+    """
+    Extract relevant context from the chat history to maintain conversation context.
+    
+    Args:
+        messages: The chat history messages
         
-        /* Text Colors */
-        --text-primary: #F1F5F9;
-        --text-secondary: #CBD5E1;
-        --text-tertiary: #94A3B8;
+    Returns:
+        str: A summarized context from the conversation history
+    """
+    context = []
+    
+    # Extract content from the last 5 messages or fewer if not enough
+    recent_messages = messages[-5:] if len(messages) > 5 else messages
+    
+    for msg in recent_messages:
+        if not isinstance(msg, dict):
+            continue
+    
+        role = msg.get("role", "")
+        content = msg.get("content", "")
         
-        /* Spacing - 8px Grid */
-        --space-1: 8px;
-        --space-2: 16px;
-        --space-3: 24px;
-        --space-4: 32px;
-        --space-5: 40px;
-        --space-6: 48px;
+        if not role or not content:
+            continue
+    
+        if role == "user":
+            # Clean up image attachments to get just the text content
+            if "[Image attached]" in content:
+                clean_content = content.replace("\n\n[Image attached]", "")
+                if clean_content.strip():  # Only add if there's actual text content
+                    context.append(f"User said: {clean_content}")
+            else:
+                context.append(f"User asked: {content}")
+        elif role == "assistant":
+            # Extract the most relevant information from assistant responses
+            if "property_report" in msg:
+                try:
+                    report = msg["property_report"]
+                    context.append(f"Assistant identified: {report['issue_assessment'][:100]}...")
+                except (KeyError, TypeError):
+                    context.append("Assistant analyzed a property issue")
+            elif "tenancy_response" in msg:
+                try:
+                    response = msg["tenancy_response"]
+                    context.append(f"Assistant answered: {response['answer'][:100]}...")
+                except (KeyError, TypeError):
+                    context.append("Assistant answered a tenancy question")
+            else:
+                # For plain text responses
+                context.append(f"Assistant replied: {content[:100]}")
+    
+    # Join the context items with appropriate separations
+    if context:
+        return " ".join(context)
+    
+    return ""
+
+# Status label shown while each agent node is running
+NODE_STATUS_LABELS = {
+    "agent_1": "Analyzing the property issue...",
+    "agent_2": "Researching your tenancy question...",
+    "clarification": "Preparing a follow-up question..."
+}
+
+# Shown in place of an answer when a graph run fails; details go to the log only
+GRAPH_ERROR_MESSAGE = "Sorry, something went wrong while handling your request. Please try again."
+
+def get_graph_loop():
+    """
+    Returns the event loop that runs graph requests off the Streamlit script thread.
+    
+    This is config.get_event_loop(), the loop the cached Gemini clients are bound
+    to. It is deliberately not an st.cache_resource: clearing Streamlit's cache
+    would then create a second loop while the lru_cached clients stay on the first.
+    """
+    from config import get_event_loop
+    return get_event_loop()
+
+# Interval between sweeps that delete idle session files
+SESSION_CLEANUP_INTERVAL_SECONDS = 15 * 60
+
+@st.cache_resource
+def start_session_cleanup():
+    """
+    Starts the daemon thread that deletes idle persisted sessions, once per process.
+    """
+    def sweep():
+        while True:
+            try:
+                deleted = session_store.cleanup_idle_sessions()
+                if deleted:
+                    logger.info(f"Deleted {deleted} idle sessions")
+            except OSError as e:
+                logger.warning(f"Session cleanup failed: {str(e)}")
+            time.sleep(SESSION_CLEANUP_INTERVAL_SECONDS)
+    
+    thread = threading.Thread(target=sweep, name="session-cleanup", daemon=True)
+    thread.start()
+    return thread
+
+def save_messages():
+    """
+    Persists the chat history of the current session; failures are logged, not raised.
+    """
+    try:
+        session_store.save_session(st.session_state.session_id, st.session_state.messages)
+    except OSError as e:
+        logger.warning(f"Could not save session: {str(e)}")
+
+# Agent answers are reused for identical requests for up to this long
+RESPONSE_CACHE_TTL_SECONDS = 3600
+RESPONSE_CACHE_SIZE = 128
+
+@st.cache_resource
+def get_response_cache():
+    """
+    Returns the process-wide cache of final graph states, keyed by request_key(),
+    together with the lock guarding it. Shared across sessions and reruns.
+    """
+    return OrderedDict(), threading.Lock()
+
+def request_key(initial_state):
+    """
+    Returns a digest identifying a graph request by its query, location and image.
+    
+    Args:
+        initial_state: The initial ChatState for the request
         
-        /* Typography Scale */
-        --text-xs: 12px;
-        --text-sm: 14px;
-        --text-base: 16px;
-        --text-lg: 20px;
-        --text-xl: 24px;
-        --text-2xl: 32px;
+    Returns:
+        str: A blake2b hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (initial_state["query"] or "", initial_state["location"] or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(initial_state["image_data"] or b"")
+    return digest.hexdigest()
+
+def get_cached_response(response_cache, key):
+    """
+    Returns the cached final state for a request key, or None if absent or expired.
+    """
+    cache, lock = response_cache
+    with lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
         
-        /* Z-Depth Levels */
-        --z-depth-0: none;
-        --z-depth-1: 0 2px 4px rgba(0, 0, 0, 0.1);
-        --z-depth-2: 0 4px 8px rgba(0, 0, 0, 0.12);
-        --z-depth-3: 0 8px 16px rgba(0, 0, 0, 0.14);
-        --z-depth-4: 0 12px 24px rgba(0, 0, 0, 0.16);
-        --z-depth-8: 0 24px 48px rgba(0, 0, 0, 0.24);
+        stored_at, final_state = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL_SECONDS:
+            del cache[key]
+            return None
         
-        /* Transitions */
-        --transition-fast: all 0.2s ease;
-        --transition-medium: all 0.3s ease;
-        --transition-slow: all 0.5s ease;
+        cache.move_to_end(key)
+        return final_state
+
+def cache_response(response_cache, key, final_state):
+    """
+    Stores a final graph state, without its image and history, if it holds a
+    structured agent answer. Plain-text responses (clarifications and errors)
+    are never cached.
+    """
+    response = final_state.get("response")
+    if response is None or isinstance(response, str):
+        return
+    
+    cache, lock = response_cache
+    with lock:
+        cache[key] = (time.monotonic(), {k: v for k, v in final_state.items() if k not in ("image_data", "chat_history")})
+        cache.move_to_end(key)
+        if len(cache) > RESPONSE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+async def _astream_graph(graph, initial_state, progress):
+    """
+    Streams the graph node by node. The agent nodes are async, so the
+    Gemini round-trips don't hold a thread while waiting on the network.
+    
+    Args:
+        graph: The compiled graph to run
+        initial_state: The initial ChatState for this request
+        progress: A list the agent node names are appended to as the router hands off
         
-        /* Borders */
-        --border-radius-sm: 4px;
-        --border-radius-md: 8px;
-        --border-radius-lg: 16px;
-        --border-width: 1px;
-    }
-
-    /* Global Styles */
-    body {
-        background-color: var(--primary-dark);
-        color: var(--text-primary);
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-        line-height: 1.5;
-        font-size: var(--text-base);
-    }
-
-    .stApp {
-        background-color: var(--primary-dark);
-    }
-
-    /* Main Content Area */
-    .main > div {
-        padding: 0 var(--space-3);
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-
-    /* Typography Hierarchy */
-    h1 {
-        font-size: var(--text-2xl) !important;
-        font-weight: 700 !important;
-        line-height: 1.2 !important;
-        margin-bottom: var(--space-2) !important;
-        color: var(--text-primary) !important;
-    }
-
-    h2 {
-        font-size: var(--text-xl) !important;
-        font-weight: 600 !important;
-        line-height: 1.3 !important;
-        margin-bottom: var(--space-2) !important;
-        color: var(--primary-accent) !important;
-    }
-
-    h3 {
-        font-size: var(--text-lg) !important;
-        font-weight: 600 !important;
-        line-height: 1.4 !important;
-        margin-bottom: var(--space-1) !important;
-        color: var (--text-primary) !important;
-    }
-
-    p {
-        font-size: var(--text-base);
-        line-height: 1.6;
-        margin-bottom: var(--space-2);
-        color: var(--text-secondary);
-    }
-
-    /* Premium Card Component Styles */
-    .premium-card {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-dark));
-        border: var(--border-width) solid rgba(255, 255, 255, 0.08);
-        border-radius: var(--border-radius-lg);
-        padding: var(--space-3);
-        margin-bottom: var(--space-3);
-        box-shadow: var(--z-depth-2), inset 0 1px 2px rgba(255, 255, 255, 0.05);
-        transition: var(--transition-medium);
-        position: relative;
-        overflow: hidden;
-    }
-
-    .premium-card:hover {
-        transform: translateY(-2px);
-        box-shadow: var(--z-depth-3), inset 0 1px 3px rgba(255, 255, 255, 0.08);
-        border-color: rgba(255, 255, 255, 0.12);
-    }
+    Returns:
+        dict: The final graph state
+    """
+    final_state = dict(initial_state)
+    async for chunk in graph.astream(initial_state, stream_mode="updates"):
+        for node, update in chunk.items():
+            final_state.update(update)
+            if node == "router" and update.get("next") in NODE_STATUS_LABELS:
+                progress.append(update["next"])
     
-    .premium-card::after {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        width: 100%;
-        height: 4px;
-        background: linear-gradient(90deg, var(--primary-accent), var(--secondary-warm));
-        opacity: 0.8;
-    }
+    return final_state
 
-    .agent-card {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light));
-        border: var(--border-width) solid rgba(255, 255, 255, 0.08);
-        border-radius: var(--border-radius-lg);
-        padding: var(--space-3);
-        margin-bottom: var(--space-3);
-        box-shadow: var(--z-depth-2), inset 0 1px 2px rgba(255, 255, 255, 0.05);
-        transition: var(--transition-medium);
-        position: relative;
-        overflow: hidden;
-        height: 100%;
-        display: flex;
-        flex-direction: column;
-    }
+# Most graph runs of one batched request (one per uploaded image) in flight at once
+MAX_GRAPH_CONCURRENCY = 5
 
-    .agent-card:hover {
-        transform: translateY(-2px);
-        box-shadow: var(--z-depth-3), inset 0 1px 3px rgba(255, 255, 255, 0.08);
-    }
+async def _astream_batch(graph, initial_states, cached_states, progress):
+    """
+    Runs the graph once per initial state, concurrently, reusing cached answers.
     
-    .agent-card::before {
-        content: '';
-        position: absolute;
-        left: 0;
-        top: 0;
-        height: 100%;
-        width: 4px;
-        background: var(--primary-accent);
-    }
-
-    .agent-title {
-        color: var(--primary-accent) !important;
-        font-size: var(--text-lg);
-        font-weight: 600;
-        margin-bottom: var(--space-2);
-        display: flex;
-        align-items: center;
-        gap: var(--space-1);
-    }
-
-    .agent-title svg {
-        width: 20px;
-        height: 20px;
-    }
-
-    /* Chat Message Styling */
-    .chat-message {
-        border-radius: var(--border-radius-lg);
-        margin: var(--space-3) 0;
-        padding: var(--space-3);
-        box-shadow: var(--z-depth-2);
-        transition: var(--transition-fast);
-        position: relative;
-        overflow: hidden;
-    }
-
-    .chat-message:hover {
-        box-shadow: var(--z-depth-3);
-    }
-
-    .chat-message.user {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light));
-        border-left: 4px solid var(--secondary-warm);
-        margin-left: var(--space-4);
-        margin-right: 0;
-    }
-
-    .chat-message.assistant {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-dark));
-        border-left: 4px solid var(--primary-accent);
-        margin-right: var(--space-4);
-        margin-left: 0;
-    }
-
-    /* Streamlit default chat message overrides */
-    .stChatMessage {
-        margin: var(--space-3) 0 !important;
-    }
-
-    .stChatMessage > div {
-        padding: 0 !important;
-    }
-
-    .stChatMessage [data-testid="chatAvatarIcon-user"],
-    .stChatMessage [data-testid="chatAvatarIcon-assistant"] {
-        top: var(--space-1) !important;
-    }
-
-    /* Main Header Styling */
-    .main-header {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-dark));
-        border-radius: var(--border-radius-lg);
-        padding: var(--space-4);
-        margin: var(--space-3) 0;
-        border: var(--border-width) solid rgba(255, 255, 255, 0.08);
-        box-shadow: var(--z-depth-2), inset 0 1px 2px rgba(255, 255, 255, 0.05);
-        position: relative;
-        overflow: hidden;
-    }
+    Args:
+        graph: The compiled graph to run
+        initial_states: The initial ChatState for each run
+        cached_states: The cached final state for each run, or None where there is none
+        progress: A list the agent node names are appended to as the router hands off
+        
+    Returns:
+        list: The final graph state of each run, in input order
+    """
+    semaphore = asyncio.Semaphore(MAX_GRAPH_CONCURRENCY)
     
-    .main-header::after {
-        content: '';
-        position: absolute;
-        bottom: 0;
-        left: 0;
-        width: 100%;
-        height: 4px;
-        background: linear-gradient(90deg, var(--primary-accent), var(--secondary-warm));
-        opacity: 0.8;
-    }
-
-    .main-header h1 {
-        color: var(--primary-accent) !important;
-        font-size: var(--text-2xl);
-        margin-bottom: var(--space-1);
-        font-weight: 700;
-    }
-
-    .main-header p {
-        color: var(--text-secondary);
-        font-size: var(--text-lg);
-        margin-bottom: 0;
-    }
-
-    /* Response Cards */
-    .property-issue,
-    .professional-referral,
-    .safety-warning,
-    .tenancy-answer,
-    .legal-references,
-    .regional-specifics,
-    .disclaimer,
-    .resources,
-    .troubleshooting {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light));
-        border-radius: var(--border-radius-md);
-        padding: var(--space-3);
-        margin-bottom: var (--space-3);
-        box-shadow: var(--z-depth-1);
-        position: relative;
-        border-left-width: 4px;
-        border-left-style: solid;
-    }
-
-    .property-issue {
-        border-left-color: var(--primary-accent);
-    }
-
-    .professional-referral {
-        border-left-color: var(--info);
-    }
-
-    .safety-warning {
-        border-left-color: var(--error);
-    }
-
-    .tenancy-answer {
-        border-left-color: var(--primary-accent);
-    }
-
-    .legal-references {
-        border-left-color: var(--info);
-    }
-
-    .regional-specifics {
-        border-left-color: var(--success);
-    }
-
-    .disclaimer {
-        border-left-color: var(--warning);
-        font-size: var(--text-sm);
-    }
-
-    .resources {
-        border-left-color: var(--secondary-warm);
-    }
-
-    .troubleshooting {
-        border-left-color: var(--success);
-    }
-
-    /* Form Controls */
-    .stButton button {
-        background: linear-gradient(145deg, var(--primary-accent), #0B7C72) !important;
-        color: white !important;
-        border-radius: var(--border-radius-md);
-        font-weight: 600;
-        padding: var(--space-1) var(--space-3) !important;
-        border: none !important;
-        box-shadow: var(--z-depth-1);
-        transition: var(--transition-fast);
-        text-transform: uppercase;
-        font-size: var(--text-sm);
-        letter-spacing: 0.5px;
-        width: 100%;
-    }
-
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: var(--z-depth-2);
-        background: linear-gradient(145deg, #0E9E92, var(--primary-accent)) !important;
-    }
-
-    .stButton button:active {
-        transform: translateY(0);
-    }
-
-    .stTextInput input, .stTextArea textarea {
-        background: var(--primary-main) !important;
-        color: var(--text-primary) !important;
-        border: var(--border-width) solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: var (--border-radius-md) !important;
-        padding: var(--space-2) !important;
-        box-shadow: var(--z-depth-0), inset 0 2px 4px rgba(0, 0, 0, 0.1) !important;
-        transition: var(--transition-fast) !important;
-    }
-
-    .stTextInput input:focus, .stTextArea textarea:focus {
-        border-color: var(--primary-accent) !important;
-        box-shadow: 0 0 0 1px var(--primary-accent), inset 0 2px 4px rgba(0, 0, 0, 0.1) !important;
-    }
-
-    .stSelectbox > div > div {
-        background: var(--primary-main) !important;
-        border: var(--border-width) solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: var(--border-radius-md) !important;
-    }
-
-    .stSelectbox > div > div:hover {
-        border-color: var(--primary-accent) !important;
-    }
-
-    /* Radio buttons and checkboxes */
-    .stRadio label {
-        color: var(--text-primary) !important;
-        font-size: var(--text-base);
-        padding: var(--space-1) 0;
-    }
-
-    .stRadio [role="radiogroup"] {
-        padding: var(--space-1) 0;
-    }
-
-    /* Sliders */
-    .stSlider [data-baseweb="slider"] {
-        margin-top: var(--space-2) !important;
-    }
-
-    .stSlider .st-c7 {
-        background: var(--primary-accent) !important;
-    }
+    async def run_one(initial_state, cached_state):
+        if cached_state is not None:
+            return cached_state
+        async with semaphore:
+            return await _astream_graph(graph, initial_state, progress)
     
-    .stSlider [data-testid="stThumbValue"] {
-        background: var(--primary-accent) !important;
-        color: white !important;
-    }
-
-    /* Location Status */
-    .location-applied {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light));
-        border-radius: var(--border-radius-md);
-        border: var(--border-width) solid rgba(255, 255, 255, 0.08);
-        padding: var(--space-2);
-        display: flex;
-        align-items: center;
-        gap: var(--space-1);
-        margin-top: var(--space-2);
-        font-size: var(--text-sm);
-    }
-
-    .location-applied-icon {
-        color: var(--success);
-        font-weight: bold;
-    }
-
-    /* Image Upload Area */
-    .image-preview {
-        border: 2px dashed rgba(255, 255, 255, 0.2);
-        border-radius: var(--border-radius-lg);
-        background: var(--primary-main);
-        padding: var(--space-2);
-        margin-top: var(--space-2);
-        transition: var(--transition-fast);
-        overflow: hidden;
-    }
-
-    .image-preview:hover {
-        border-color: var(--primary-accent);
-    }
+    return await asyncio.gather(*(
+        run_one(initial_state, cached_state)
+        for initial_state, cached_state in zip(initial_states, cached_states)
+    ))
+
+async def _run_graph_request(graph, initial_states, cached_states, keys, response_cache, progress):
+    """
+    Runs _astream_batch to completion on the graph loop and caches the new answers.
+    """
+    final_states = await _astream_batch(graph, initial_states, cached_states, progress)
+    for key, cached_state, final_state in zip(keys, cached_states, final_states):
+        if cached_state is None:
+            cache_response(response_cache, key, final_state)
     
-    .image-preview img {
-        border-radius: var(--border-radius-md);
-        box-shadow: var(--z-depth-1);
-    }
+    return final_states
 
-    /* File uploader enhancements */
-    .stFileUploader > div {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-dark)) !important;
-        border-radius: var(--border-radius-md) !important;
-        border: 1px dashed rgba(255, 255, 255, 0.2) !important;
-        padding: var(--space-2) !important;
-    }
+def submit_graph_request(initial_states):
+    """
+    Starts a graph request in the background: one graph run per initial state,
+    e.g. one per uploaded image. Runs whose identical request completed recently
+    are answered from the response cache instead.
     
-    .stFileUploader [data-testid="stFileUploaderDropzone"] {
-        background: transparent !important;
-    }
+    Returns:
+        dict: The pending request, holding the future and its progress list
+    """
+    progress = []
+    response_cache = get_response_cache()
+    keys = [request_key(initial_state) for initial_state in initial_states]
+    cached_states = [get_cached_response(response_cache, key) for key in keys]
+    if all(cached_state is not None for cached_state in cached_states):
+        logger.debug("Response cache hit for requests %s", keys)
+        future = Future()
+        future.set_result(cached_states)
+        return {"future": future, "progress": progress}
     
-    .stFileUploader [data-testid="stFileUploaderDropzone"]:hover {
-        background: rgba(255, 255, 255, 0.05) !important;
-    }
+    future = asyncio.run_coroutine_threadsafe(
+        _run_graph_request(get_graph(), initial_states, cached_states, keys, response_cache, progress),
+        get_graph_loop()
+    )
+    return {"future": future, "progress": progress}
 
-    /* Sidebar Styling */
-    .stSidebar {
-        background: var(--primary-main) !important;
-        border-right: var(--border-width) solid rgba(255, 255, 255, 0.05);
-    }
+def wait_for_graph(pending_request):
+    """
+    Waits for a pending graph request, showing its progress in an st.status box.
     
-    .stSidebar [data-testid="stSidebar"] {
-        width: 320px !important;
-    }
-
-    .stSidebar .stMarkdown h3 {
-        font-size: var(--text-lg) !important;
-        color: var(--primary-accent) !important;
-        margin-top: var(--space-3) !important;
-        padding-bottom: var(--space-1);
-        border-bottom: var(--border-width) solid rgba(255, 255, 255, 0.1);
-    }
+    If a widget interaction reruns the script while waiting, the request keeps
+    running and the next run resumes waiting on the same future.
     
-    /* Sidebar section separation */
-    .stSidebar > div > div > div > div:not(:first-child) {
-        margin-top: var(--space-3);
-        padding-top: var(--space-3);
-        border-top: 1px solid rgba(255, 255, 255, 0.05);
-    }
-
-    /* Footer */
-    .footer {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-dark));
-        border-top: var(--border-width) solid rgba(255, 255, 255, 0.05);
-        padding: var(--space-3);
-        margin-top: var(--space-4);
-        border-radius: var(--border-radius-md);
-        font-size: var(--text-sm);
-        color: var(--text-tertiary);
-        text-align: center;
-    }
-
-    .footer strong {
-        color: var(--text-secondary);
-    }
-
-    /* Code Blocks */
-    code {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light)) !important;
-        color: var(--primary-accent) !important;
-        padding: 2px 6px !important;
-        border-radius: var(--border-radius-sm) !important;
-        font-size: var(--text-sm) !important;
-        font-family: 'JetBrains Mono', monospace !important;
-    }
-
-    /* Markdown Content */
-    .stMarkdown p {
-        color: var(--text-secondary);
-        line-height: 1.7;
-        font-size: var(--text-base);
-    }
-
-    .stMarkdown strong {
-        color: var(--text-primary);
-        font-weight: 600;
-    }
-
-    .stMarkdown ul, .stMarkdown ol {
-        margin-left: var(--space-3);
-        margin-bottom: var(--space-3);
-    }
-
-    .stMarkdown li {
-        margin-bottom: var(--space-1);
-        color: var(--text-secondary);
-    }
-
-    /* Make the chat input more prominent */
-    .stChatInput {
-        padding-top: var(--space-1) !important;
-        border-top: var(--border-width) solid rgba(255, 255, 255, 0.05);
-        margin: var(--space-3) 0 !important;
-    }
+    Returns:
+        list: The final graph state of each run in the request
+    """
+    future = pending_request["future"]
+    progress = pending_request["progress"]
+    with st.status("Routing your request...", expanded=False) as status:
+        shown = 0
+        while not wait([future], timeout=0.25).done:
+            # Only push a new label when another node has started
+            if len(progress) > shown:
+                shown = len(progress)
+                status.update(label=NODE_STATUS_LABELS[progress[-1]])
+        status.update(label="Response ready", state="complete")
+    
+    return future.result()
+
+def _fast_hash(data):
+    """
+    Returns a short blake2b hex digest of the given bytes.
+    Used for upload de-duplication and as the cache key for image bytes.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _flatten_to_rgb(img):
+    """
+    Converts an image to RGB for JPEG encoding. Transparent areas (e.g. in PNG
+    screenshots) are composited onto white; a bare convert("RGB") turns them black.
+    """
+    from PIL import Image
+    
+    if img.mode not in ("RGBA", "LA", "PA") and "transparency" not in img.info:
+        return img.convert("RGB")
+    
+    img = img.convert("RGBA")
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel("A"))
+    return background
+
+# Bounds on the process-wide image caches below; every session's uploads pass
+# through them, and the images themselves are kept in the session store
+IMAGE_CACHE_MAX_ENTRIES = 64
+IMAGE_CACHE_TTL_SECONDS = 60 * 60
+
+# Longest edge, in pixels, that uploaded images are downscaled to
+MAX_IMAGE_SIDE = 1024
+
+# EXIF tag holding the camera orientation of a photo
+EXIF_ORIENTATION_TAG = 0x0112
+
+@st.cache_data(
+    show_spinner=False,
+    hash_funcs={bytes: _fast_hash},
+    max_entries=IMAGE_CACHE_MAX_ENTRIES,
+    ttl=IMAGE_CACHE_TTL_SECONDS
+)
+def downscale_image(image_bytes, max_side=MAX_IMAGE_SIDE):
+    """
+    Normalizes an uploaded image before it is stored or sent to the graph:
+    the longest edge is capped at max_side pixels and the result is encoded as JPEG.
+    
+    Args:
+        image_bytes: The raw bytes of the uploaded image
+        max_side: The maximum length of the longest edge in pixels
+        
+    Returns:
+        bytes: JPEG-encoded image bytes, or the original bytes if already a small enough, upright JPEG
+    """
+    # Deferred so reruns without images never load Pillow
+    from PIL import Image, ImageOps
+    
+    img = Image.open(io.BytesIO(image_bytes))
+    
+    # Re-encoding drops EXIF, so rotate portrait phone photos upright while the
+    # Orientation tag is still there
+    upright = img.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+    is_jpeg = img.format == "JPEG"
+    img = ImageOps.exif_transpose(img)
+    
+    scale = max_side / max(img.size)
+    if scale >= 1 and is_jpeg and upright:
+        return image_bytes
+    
+    if scale < 1:
+        width, height = img.size
+        img = img.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+    
+    buf = io.BytesIO()
+    _flatten_to_rgb(img).save(buf, format="JPEG", quality=85, optimize=True)
+    return buf.getvalue()
 
-    .stChatInput > div {
-        background: linear-gradient(145deg, var(--primary-main), var(--primary-light)) !important;
-        border-radius: var(--border-radius-lg) !important;
-        padding: var(--space-1) !important;
-        border: var(--border-width) solid rgba(255, 255, 255, 0.1) !important;
-        box-shadow: var(--z-depth-2) !important;
-    }
+# Display width, in pixels, of images shown in the chat history
+HISTORY_IMAGE_WIDTH = 480
 
-    .stChatInput input {
-        background: transparent !important;
-        color: var(--text-primary) !important;
-        padding: var(--space-2) !important;
-        font-size: var(--text-base) !important;
-    }
+# Display size, in pixels, of the sidebar upload preview
+PREVIEW_IMAGE_SIZE = 256
 
-    /* Fix for the black box behind chat input */
-    .stChatInput div[data-baseweb="input"] {
-        background-color: transparent !important;
-    }
+@st.cache_data(
+    show_spinner=False,
+    hash_funcs={bytes: _fast_hash},
+    max_entries=IMAGE_CACHE_MAX_ENTRIES,
+    ttl=IMAGE_CACHE_TTL_SECONDS
+)
+def make_thumbnail(image_bytes, size=HISTORY_IMAGE_WIDTH):
+    """
+    Creates a small JPEG thumbnail for displaying an image in the UI.
     
-    .stChatInput [data-testid="stChatInputContainer"] {
-        background-color: transparent !important;
-    }
+    Args:
+        image_bytes: The raw bytes of the image
+        size: The maximum width and height of the thumbnail in pixels
+        
+    Returns:
+        bytes: JPEG-encoded thumbnail bytes
+    """
+    from PIL import Image, ImageOps
     
-    /* Override Streamlit chat input container backgrounds */
-    /* This specifically targets the black box behind the chat input */
-    .stChatInput div[data-baseweb="input"] {
-        background-color: transparent !important;
-    }
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    img.thumbnail((size, size))
     
-    .stChatInput [data-testid="stChatInputContainer"] {
-        background-color: transparent !important;
-    }
+    buf = io.BytesIO()
+    _flatten_to_rgb(img).save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=IMAGE_CACHE_MAX_ENTRIES, ttl=IMAGE_CACHE_TTL_SECONDS)
+def history_thumbnail(session_id, image_key):
+    """
+    Returns the history thumbnail for an image kept in the session store.
+    Image keys are content hashes, so the pair always names the same image.
     
-    /* Also target the input element itself to ensure it's transparent */
-    .stChatInput div[data-baseweb="input"] > div {
-        background-color: transparent !important;
-    }
+    Returns:
+        bytes: The JPEG thumbnail, or None if the image is no longer on disk
+    """
+    try:
+        image_bytes = session_store.load_image(session_id, image_key)
+    except OSError as e:
+        logger.warning(f"Could not load image {image_key}: {str(e)}")
+        return None
+    return make_thumbnail(image_bytes)
+
+def _boxed_section(title, accent, body, css_class=None):
+    """
+    Formats a titled section whose Markdown body is wrapped in a response box.
+    accent is a modifier class from the stylesheet (e.g. "info") that colors the box's left border.
     
-    /* Target any potential nested divs that might have background color */
-    .stChatInput div[data-baseweb="input"] div {
-        background-color: transparent !important;
-    }
+    The body is model output, so HTML in it is escaped; Markdown still renders.
+    """
+    heading = f"### {title}\n\n" if title else ""
+    classes = " ".join(filter(None, ["response-box", accent, css_class]))
+    return f'{heading}<div class="{classes}">\n\n{html.escape(body, quote=False)}\n\n</div>'
+
+def _numbered_list(items):
+    """
+    Formats a list of strings as a Markdown numbered list, dropping repeated items
+    (the model sometimes lists the same suggestion twice) while keeping their order.
+    """
+    return "\n".join(f"{i}. {item}" for i, item in enumerate(dict.fromkeys(items), 1))
+
+@st.cache_data(show_spinner=False)
+def render_property_report_html(report_json):
+    """
+    Builds the HTML/Markdown block for a PropertyIssueReport.
     
-    /* Important fix for the black background box */
-    .stChatInput div:has(>div[data-baseweb="input"]) {
-        background-color: transparent !important;
-    }
+    Args:
+        report_json: The report serialized with model_dump_json(), used as the cache key
+        
+    Returns:
+        str: A single block to emit with one st.markdown call
+    """
+    report = json.loads(report_json)
+    sections = [_boxed_section("Property Issue Assessment", "primary-accent", report["issue_assessment"])]
     
-    /* Final catch-all for any deeply nested elements */
-    .stChatInput * {
-        background-color: transparent !important;
-    }
-
-    .stChatInput button svg {
-        color: var(--primary-accent) !important;
-    }
-
-    /* Spinner Styling */
-    .stSpinner > div {
-        border-color: var(--primary-accent) transparent var(--primary-accent) transparent !important;
-    }
+    if report["troubleshooting_suggestions"]:
+        sections.append(_boxed_section("Troubleshooting Suggestions", "success", _numbered_list(report["troubleshooting_suggestions"])))
     
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        color: var(--text-primary) !important;
-        background: linear-gradient(145deg, var(--primary-main), var (--primary-light)) !important;
-        border-radius: var(--border-radius-md) !important;
-        padding: var(--space-2) var(--space-3) !important;
-    }
+    if report["professional_referral"]:
+        sections.append(_boxed_section("Professional Referrals", "info", _numbered_list(report["professional_referral"])))
     
-    .streamlit-expanderHeader:hover {
-        background: linear-gradient(145deg, var(--primary-light), var(--primary-main)) !important;
-    }
+    if report["safety_warnings"]:
+        sections.append(_boxed_section("⚠️ Safety Warnings", "error", _numbered_list(report["safety_warnings"])))
     
-    .streamlit-expanderContent {
-        background: rgba(255, 255, 255, 0.02) !important;
-        border-radius: 0 0 var(--border-radius-md) var(--border-radius-md) !important;
-        padding: var(--space-2) !important;
-    }
+    return "\n\n".join(sections)
 
-    /* Custom Z-depth classes for optional use */
-    .z-depth-0 { box-shadow: var(--z-depth-0); }
-    .z-depth-1 { box-shadow: var(--z-depth-1); }
-    .z-depth-2 { box-shadow: var(--z-depth-2); }
-    .z-depth-3 { box-shadow: var(--z-depth-3); }
-    .z-depth-4 { box-shadow: var(--z-depth-4); }
-    .z-depth-8 { box-shadow: var(--z-depth-8); }
-    
-    /* Responsive adjustments */
-    @media screen and (max-width: 768px) {
-        :root {
-            --text-xs: 10px;
-            --text-sm: 12px;
-            --text-base: 14px;
-            --text-lg: 18px;
-            --text-xl: 20px;
-            --text-2xl: 24px;
-            
-            --space-1: 4px;
-            --space-2: 8px;
-            --space-3: 16px;
-            --space-4: 24px;
-            --space-5: 32px;
-            --space-6: 40px;
-        }
-        
-        .main > div {
-            padding: 0 var(--space-2);
-        }
-        
-        .chat-message.user {
-            margin-left: var(--space-2);
-        }
-        
-        .chat-message.assistant {
-            margin-right: var(--space-2);
-        }
+@st.cache_data(show_spinner=False)
+def render_tenancy_html(response_json):
+    """
+    Builds the HTML/Markdown block for a TenancyFAQResponse.
+    
+    Args:
+        response_json: The response serialized with model_dump_json(), used as the cache key
         
-        .main-header {
-            padding: var(--space-3);
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Add title and description
-st.markdown('<div class="main-header"><h1>🏠 PropertyLoop Assistant</h1><p>Your virtual real estate consultant</p></div>', unsafe_allow_html=True)
-
-# Two-column layout for agent description
-col1, col2 = st.columns(2)
-
-with col1:
-    st.markdown('<div class="agent-card"><p class="agent-title">🔍 Agent 1: Issue Detection & Troubleshooting</p><p>Upload property images to identify issues like water damage, mold, cracks, broken fixtures, etc. Get troubleshooting advice and professional recommendations.</p></div>', unsafe_allow_html=True)
+    Returns:
+        str: A single block to emit with one st.markdown call
+    """
+    response = json.loads(response_json)
+    sections = [_boxed_section("Answer", "primary-accent", response["answer"])]
+    
+    if response["legal_references"]:
+        sections.append(_boxed_section("Legal References", "info", _numbered_list(response["legal_references"])))
+    
+    if response["regional_specifics"]:
+        sections.append(_boxed_section("Regional Information", "success", response["regional_specifics"]))
+    
+    if response["additional_resources"]:
+        sections.append(_boxed_section("Additional Resources", "secondary-warm", _numbered_list(response["additional_resources"])))
+    
+    sections.append(_boxed_section(None, "warning", response["disclaimer"], "disclaimer"))
+    
+    return "\n\n".join(sections)
+
+def render_property_report(report):
+    """
+    Renders a PropertyIssueReport, stored as its model_dump() dict, with a single st.markdown call.
+    """
+    st.markdown(render_property_report_html(json.dumps(report)), unsafe_allow_html=True)
+
+def render_tenancy_response(response):
+    """
+    Renders a TenancyFAQResponse, stored as its model_dump() dict, with a single st.markdown call.
+    """
+    st.markdown(render_tenancy_html(json.dumps(response)), unsafe_allow_html=True)
+
+def render_message(message):
+    """
+    Renders a single chat message from st.session_state.messages.
+    
+    Args:
+        message: The message dictionary containing role, content and optional image or report
+    """
+    if message["role"] == "user":
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(message["content"])
+            if "image_keys" in message:
+                # Display the images if the message has any; only their keys are kept in session state
+                thumbnails = [history_thumbnail(st.session_state.session_id, key) for key in message["image_keys"]]
+                available = [thumbnail for thumbnail in thumbnails if thumbnail is not None]
+                if available:
+                    st.image(
+                        available,
+                        caption=["Uploaded Image"] * len(available),
+                        width=HISTORY_IMAGE_WIDTH
+                    )
+                
+                # Images removed from disk (e.g. by the idle cleanup) get a placeholder instead
+                missing = len(thumbnails) - len(available)
+                if missing:
+                    st.caption("Image no longer available" if missing == 1 else f"{missing} images no longer available")
+    else:  # assistant message
+        with st.chat_message("assistant", avatar="🏠"):
+            if "rendered_html" in message:
+                # Reports are rendered once when appended; replay the stored block
+                st.markdown(message["rendered_html"], unsafe_allow_html=True)
+            
+            elif "property_report" in message:
+                # Format PropertyIssueReport in a structured way
+                render_property_report(message["property_report"])
+            
+            elif "tenancy_response" in message:
+                # Format TenancyFAQResponse in a structured way
+                render_tenancy_response(message["tenancy_response"])
+                
+            else:
+                # Regular text message
+                st.markdown(message["content"])
 
-with col2:
-    st.markdown('<div class="agent-card"><p class="agent-title">📜 Agent 2: Tenancy FAQ</p><p>Get answers about tenancy laws, agreements, landlord/tenant responsibilities, and rental processes. Provide your location for region-specific guidance.</p></div>', unsafe_allow_html=True)
+@st.experimental_fragment
+def render_history():
+    """
+    Renders the chat history. Streamlit drops any element a rerun does not re-emit,
+    so only the most recent messages are drawn each run; older ones are materialized
+    only while the user has asked to see them.
+    
+    As a fragment, toggling the earlier messages reruns only this function.
+    """
+    earlier_messages = st.session_state.messages[:-MAX_VISIBLE_MESSAGES]
+    if earlier_messages and st.toggle(f"Show {len(earlier_messages)} earlier messages", key="show_earlier_messages"):
+        for message in earlier_messages:
+            render_message(message)
+    
+    for message in st.session_state.messages[-MAX_VISIBLE_MESSAGES:]:
+        render_message(message)
 
-# Sidebar for additional context
-with st.sidebar:
-    st.header("Additional Context")
+@st.experimental_fragment
+def render_context_inputs():
+    """
+    Renders the location and property-detail widgets in the sidebar.
     
+    As a fragment, changing one of these widgets reruns only this function
+    rather than the whole script, so the chat history is not redrawn. The
+    values are stored under their widget keys in st.session_state.
+    """
     # Location input with confirmation indicator
     if "location_set" not in st.session_state:
         st.session_state.location_set = False
     
-    # Location input with autocomplete suggestions
-    popular_locations = ["London, UK", "New York, USA", "Sydney, Australia", "Toronto, Canada", "Berlin, Germany"]
-    location = st.text_input("Location (City/Country):", key="location", 
-                            placeholder="E.g. London, UK",
-                            on_change=lambda: setattr(st.session_state, 'location_set', bool(st.session_state.location)))
+    st.text_input("Location (City/Country):", key="location", 
+                  placeholder="E.g. London, UK",
+                  on_change=lambda: setattr(st.session_state, 'location_set', bool(st.session_state.location)))
     
     # Show confirmation if location is set
     if st.session_state.location_set and st.session_state.location:
-        st.markdown(f'<div class="location-applied"><span class="location-applied-icon">✓</span> Location set to: {st.session_state.location}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="location-applied"><span class="location-applied-icon">✓</span> Location set to: {html.escape(st.session_state.location)}</div>', unsafe_allow_html=True)
     
     # Property type selection
     st.subheader("Property Details")
-    property_type = st.selectbox(
+    st.selectbox(
         "Property Type:",
         ["Apartment/Flat", "House", "Condo", "Studio", "Commercial", "Other"],
-        index=0
+        index=0,
+        key="property_type"
     )
     
     # Occupancy status
-    occupancy = st.radio(
+    st.radio(
         "Occupancy Status:",
-        ["Owner-occupied", "Tenant-occupied", "Vacant", "Not applicable"]
+        ["Owner-occupied", "Tenant-occupied", "Vacant", "Not applicable"],
+        key="occupancy"
     )
     
     # Property age slider
-    property_age = st.slider("Property Age (years):", 0, 100, 10)
+    st.slider("Property Age (years):", 0, 100, 10, key="property_age")
+
+# Premium enterprise SaaS dark theme with 8px grid system, loaded from static/styles.css
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
+
+# Add title and description
+st.markdown('<div class="main-header"><h1>🏠 PropertyLoop Assistant</h1><p>Your virtual real estate consultant</p></div>', unsafe_allow_html=True)
+
+# Two-column layout for agent description
+col1, col2 = st.columns(2)
+
+with col1:
+    st.markdown('<div class="agent-card"><p class="agent-title">🔍 Agent 1: Issue Detection & Troubleshooting</p><p>Upload property images to identify issues like water damage, mold, cracks, broken fixtures, etc. Get troubleshooting advice and professional recommendations.</p></div>', unsafe_allow_html=True)
+
+with col2:
+    st.markdown('<div class="agent-card"><p class="agent-title">📜 Agent 2: Tenancy FAQ</p><p>Get answers about tenancy laws, agreements, landlord/tenant responsibilities, and rental processes. Provide your location for region-specific guidance.</p></div>', unsafe_allow_html=True)
+
+# Sidebar for additional context
+with st.sidebar:
+    st.header("Additional Context")
+    
+    # Location and property details; their values are read back from session state
+    render_context_inputs()
     
     st.markdown("---")
     
     # Upload image section with preview
     st.subheader("Property Image")
-    uploaded_file = st.file_uploader("Upload an image of the property issue", type=["jpg", "jpeg", "png"])
+    uploaded_files = st.file_uploader(
+        "Upload images of the property issue",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True
+    )
     
-    if uploaded_file is not None:
+    # Reset the processed flag only when the uploaded content actually changes;
+    # UploadedFile objects are recreated on every rerun so they can't be compared directly
+    new_upload = False
+    if uploaded_files:
+        uploaded_bytes = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+        file_hash = _fast_hash(b"".join(_fast_hash(data).encode("ascii") for data in uploaded_bytes))
+        if st.session_state.get("last_file_hash") != file_hash:
+            st.session_state.last_file_hash = file_hash
+            new_upload = True
+            st.session_state.image_processed = False
+            st.session_state.reset_image_processed = False
+    
+    if uploaded_files:
         st.markdown('<div class="image-preview">', unsafe_allow_html=True)
-        st.image(uploaded_file, caption="Image Preview", use_column_width=True)
+        st.image(
+            [make_thumbnail(data, PREVIEW_IMAGE_SIZE) for data in uploaded_bytes],
+            caption=["Image Preview"] * len(uploaded_bytes),
+            width=PREVIEW_IMAGE_SIZE
+        )
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Show image status
@@ -775,19 +793,36 @@ with st.sidebar:
     
     # Clear chat button
     if st.button("Clear Chat History"):
+        session_store.delete_session(st.session_state.session_id)
         st.session_state.messages = []
         st.session_state.location_set = False
         st.session_state.image_processed = False
+        st.session_state.pending_request = None
+        st.session_state.is_chat_input_disabled = False
         st.rerun()
 
-# Initialize chat history
+# Identify the session in the URL so a page refresh restores its history
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("session")
+    if not session_store.is_valid_session_id(session_id):
+        session_id = session_store.new_session_id()
+        st.query_params["session"] = session_id
+    st.session_state.session_id = session_id
+
+start_session_cleanup()
+
+# Initialize chat history, restoring it from disk if this session was saved
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = session_store.load_session(st.session_state.session_id)
 
 # Add a variable to track if chat input should be disabled during processing
 if "is_chat_input_disabled" not in st.session_state:
     st.session_state.is_chat_input_disabled = False
 
+# Add a variable to hold the in-flight graph request, if any
+if "pending_request" not in st.session_state:
+    st.session_state.pending_request = None
+
 # Add a variable to track if an image has been processed
 if "image_processed" not in st.session_state:
     st.session_state.image_processed = False
@@ -800,375 +835,208 @@ if "reset_image_processed" not in st.session_state:
 if "last_agent" not in st.session_state:
     st.session_state.last_agent = None
 
-# Display chat history
-for message in st.session_state.messages:
-    if message["role"] == "user":
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(message["content"])
-            if "image" in message:
-                # Display image if it exists in the message
-                image_data = base64.b64decode(message["image"])
-                st.image(image_data, caption="Uploaded Image", use_column_width=True)
-    else:  # assistant message
-        with st.chat_message("assistant", avatar="🏠"):
-            if "property_report" in message:
-                # Format PropertyIssueReport in a structured way
-                report = message["property_report"]
-                
-                st.markdown(f"### Property Issue Assessment")
-                st.markdown(f'<div class="property-issue">{report.issue_assessment}</div>', unsafe_allow_html=True)
-                
-                if report.troubleshooting_suggestions:
-                    st.markdown("### Troubleshooting Suggestions")
-                    st.markdown('<div class="troubleshooting">', unsafe_allow_html=True)
-                    for i, suggestion in enumerate(report.troubleshooting_suggestions, 1):
-                        st.markdown(f"{i}. {suggestion}")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                if report.professional_referral:
-                    st.markdown("### Professional Referrals")
-                    st.markdown('<div class="professional-referral">', unsafe_allow_html=True)
-                    for i, referral in enumerate(report.professional_referral, 1):
-                        st.markdown(f"{i}. {referral}")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                if report.safety_warnings:
-                    st.markdown("### ⚠️ Safety Warnings")
-                    st.markdown('<div class="safety-warning">', unsafe_allow_html=True)
-                    for i, warning in enumerate(report.safety_warnings, 1):
-                        st.markdown(f"{i}. {warning}")
-                    st.markdown('</div>', unsafe_allow_html=True)
-            
-            elif "tenancy_response" in message:
-                # Format TenancyFAQResponse in a structured way
-                response = message["tenancy_response"]
-                
-                st.markdown("### Answer")
-                st.markdown(f'<div class="tenancy-answer">{response.answer}</div>', unsafe_allow_html=True)
-                
-                if response.legal_references and len(response.legal_references) > 0:
-                    st.markdown("### Legal References")
-                    st.markdown('<div class="legal-references">', unsafe_allow_html=True)
-                    for i, reference in enumerate(response.legal_references, 1):
-                        st.markdown(f"{i}. {reference}")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                if response.regional_specifics:
-                    st.markdown("### Regional Information")
-                    st.markdown(f'<div class="regional-specifics">{response.regional_specifics}</div>', unsafe_allow_html=True)
-                
-                if response.additional_resources and len(response.additional_resources) > 0:
-                    st.markdown("### Additional Resources")
-                    st.markdown('<div class="resources">', unsafe_allow_html=True)
-                    for i, resource in enumerate(response.additional_resources, 1):
-                        st.markdown(f"{i}. {resource}")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.markdown(f'<div class="disclaimer">{response.disclaimer}</div>', unsafe_allow_html=True)
-                
-            else:
-                # Regular text message
-                st.markdown(message["content"])
+# Display chat history; chat_area keeps new turns in the same column
+chat_area = st.container()
+with chat_area:
+    render_history()
 
 # User input area
 user_input = st.chat_input("Type your question here...", disabled=st.session_state.is_chat_input_disabled)
 
-# When a user submits input
-if user_input or (uploaded_file and not st.session_state.image_processed):
-    # Reset image processed flag when a new file is uploaded
-    if uploaded_file and ('last_file' not in st.session_state or uploaded_file != st.session_state.get('last_file')):
-        st.session_state.last_file = uploaded_file
-        st.session_state.image_processed = False
-        # Set the reset flag to prevent automatic processing after the first input
-        st.session_state.reset_image_processed = False
-        
-    # Prepare image data if uploaded
-    image_data = None
-    if uploaded_file is not None and not st.session_state.image_processed:
-        # Read the file into bytes
-        image_bytes = uploaded_file.getvalue()
-        image_data = image_bytes
+# When a user submits input. Nothing is submitted while a previous request is still
+# running; a new upload stays unprocessed and is picked up once that request finishes.
+if st.session_state.pending_request is not None:
+    if user_input or new_upload:
+        st.toast("Still working on your previous request...")
+elif user_input or (uploaded_files and not st.session_state.image_processed):
+    # Prepare image data if uploaded; each image gets its own graph run
+    images = []
+    if uploaded_files and not st.session_state.image_processed:
+        # Read the files into bytes, downscaling large photos before they are stored or sent
+        images = [downscale_image(data) for data in uploaded_bytes]
         
-        # Display the user's image in the chat
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(user_input if user_input else "")
-            st.image(image_bytes, caption="Uploaded Image", use_column_width=True)
-        
-        # Add to session state with the image
-        image_b64 = base64.b64encode(image_bytes).decode()
+        # Write the images to the session store and keep only their keys in session state
         if user_input:
             message_content = f"{user_input}\n\n[Image attached]"
         else:
             message_content = "[Image attached]"
-        st.session_state.messages.append({"role": "user", "content": message_content, "image": image_b64})
+        image_keys = [session_store.store_image(st.session_state.session_id, image) for image in images]
+        user_message = {"role": "user", "content": message_content, "image_keys": image_keys}
         
         # Only mark image as processed after a successful API call
         st.session_state.reset_image_processed = True
-    elif user_input:
-        # Text-only message
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(user_input)
-        st.session_state.messages.append({"role": "user", "content": user_input})
     else:
-        # No input, no unprocessed image - do nothing
-        pass
+        # Text-only message
+        user_message = {"role": "user", "content": user_input}
+    
+    # Render the new turn through the same path as the history
+    append_message(user_message)
+    with chat_area:
+        render_message(user_message)
     
     # Disable chat input during processing
     st.session_state.is_chat_input_disabled = True
     
-    # Show a spinner while processing
-    with st.spinner("Processing your request..."):
-        # Get additional context from sidebar
-        context_info = {
-            "location": st.session_state.location if hasattr(st.session_state, 'location') and st.session_state.location else None,
-            "property_type": property_type,
-            "occupancy": occupancy,
-            "property_age": property_age
-        }
-        
-        # Format context for query
-        context_str = ""
-        if context_info["location"]:
-            context_str += f" Location: {context_info['location']}."
-        if context_info["property_type"] != "Other":
-            context_str += f" Property type: {context_info['property_type']}."
-        if context_info["occupancy"] != "Not applicable":
-            context_str += f" Occupancy: {context_info['occupancy']}."
-        if context_info["property_age"] > 0:
-            context_str += f" Property age: {context_info['property_age']} years."
-        
-        # Append context to query if it exists
-        enhanced_query = user_input if user_input else ""
-        
-        # Context management helper functions
-        def extract_context_from_history(messages):
-            """
-            Extract relevant context from the chat history to maintain conversation context.
-            
-            Args:
-                messages: The chat history messages
-                
-            Returns:
-                str: A summarized context from the conversation history
-            """
-            context = []
-            
-            # Extract content from the last 5 messages or fewer if not enough
-            recent_messages = messages[-5:] if len(messages) > 5 else messages
-            
-            for msg in recent_messages:
-                if not isinstance(msg, dict):
-                    continue
-            
-                role = msg.get("role", "")
-                content = msg.get("content", "")
-                
-                if not role or not content:
-                    continue
-            
-                if role == "user":
-                    # Clean up image attachments to get just the text content
-                    if "[Image attached]" in content:
-                        clean_content = content.replace("\n\n[Image attached]", "")
-                        if clean_content.strip():  # Only add if there's actual text content
-                            context.append(f"User said: {clean_content}")
-                    else:
-                        context.append(f"User asked: {content}")
-                elif role == "assistant":
-                    # Extract the most relevant information from assistant responses
-                    if "property_report" in msg:
-                        try:
-                            report = msg["property_report"]
-                            context.append(f"Assistant identified: {report.issue_assessment[:100]}...")
-                        except (AttributeError, TypeError):
-                            context.append("Assistant analyzed a property issue")
-                    elif "tenancy_response" in msg:
-                        try:
-                            response = msg["tenancy_response"]
-                            context.append(f"Assistant answered: {response.answer[:100]}...")
-                        except (AttributeError, TypeError):
-                            context.append("Assistant answered a tenancy question")
-                    else:
-                        # For plain text responses
-                        context.append(f"Assistant replied: {content[:100]}")
-            
-            # Join the context items with appropriate separations
-            if context:
-                return " ".join(context)
-            
-            return ""
-
-        # Extract conversation context from history
-        conversation_context = extract_context_from_history(st.session_state.messages)
-        
-        # Include relevant conversation context
-        if conversation_context:
-            logger.debug(f"Extracted conversation context: {conversation_context}")
-            if enhanced_query:
-                enhanced_query = f"Previous context: {conversation_context}\n\nCurrent query: {enhanced_query}"
-            else:
-                enhanced_query = f"Previous context: {conversation_context}"
+    # Get additional context from sidebar
+    context_info = {
+        "location": st.session_state.get("location") or None,
+        "property_type": st.session_state.property_type,
+        "occupancy": st.session_state.occupancy,
+        "property_age": st.session_state.property_age
+    }
+    
+    # Format context for query
+    context_str = build_context_str(**context_info)
+    
+    # Append context to query if it exists
+    enhanced_query = user_input if user_input else ""
+    
+    # Extract conversation context from history
+    conversation_context = extract_context_from_history(st.session_state.messages)
+    
+    # Include relevant conversation context
+    if conversation_context:
+        logger.debug("Extracted conversation context: %s", conversation_context)
+        if enhanced_query:
+            enhanced_query = f"Previous context: {conversation_context}\n\nCurrent query: {enhanced_query}"
         else:
-            logger.debug("No conversation context extracted from history")
-        
-        # Add additional context from sidebar if available
-        if context_str and enhanced_query:
-            enhanced_query += f"\n\nAdditional context:{context_str}"
-            logger.debug(f"Added property context: {context_str}")
-        
-        logger.debug(f"Final enhanced query: {enhanced_query}")
-        
-        # Add debug logging for tenancy questions
-        if user_input and not uploaded_file:
+            enhanced_query = f"Previous context: {conversation_context}"
+    else:
+        logger.debug("No conversation context extracted from history")
+    
+    # Add additional context from sidebar if available
+    if context_str and enhanced_query:
+        enhanced_query += f"\n\nAdditional context:{context_str}"
+        logger.debug("Added property context: %s", context_str)
+    
+    logger.debug("Final enhanced query: %s", enhanced_query)
+    
+    # Add debug logging for tenancy questions
+    if user_input and not uploaded_files:
+        if logger.isEnabledFor(logging.DEBUG):
             # Check if input looks like a tenancy question
             tenancy_keywords = ["tenant", "landlord", "rent", "lease", "notice", "deposit", "eviction", 
                                "contract", "tenancy", "agreement", "property manager", "vacate"]
             
             is_likely_tenancy = any(keyword in user_input.lower() for keyword in tenancy_keywords)
-            logger.debug(f"Query: {user_input}")
-            logger.debug(f"Is likely tenancy question: {is_likely_tenancy}")
-            logger.debug(f"Context string: {context_str}")
-            
-            # Force tenancy mode for common tenancy questions
-            if "notice" in user_input.lower() and "vacate" in user_input.lower():
-                logger.debug("Detected notice to vacate question - forcing tenancy mode")
-                # Add a hint to the query to help the model recognize this as a tenancy question
-                enhanced_query = f"[TENANCY QUESTION] {enhanced_query}"
-        
-        # Prepare initial state for the graph
-        initial_state = {
-            "query": enhanced_query,
-            "image_data": image_data,  # Always include image_data if it's being processed in this request
-            "location": context_info["location"],
-            "response": None,
-            "sender": "user",
-            "chat_history": st.session_state.messages
-        }
+            logger.debug("Query: %s", user_input)
+            logger.debug("Is likely tenancy question: %s", is_likely_tenancy)
+            logger.debug("Context string: %s", context_str)
         
-        # Log initial state without the large data
+        # Force tenancy mode for common tenancy questions
+        if "notice" in user_input.lower() and "vacate" in user_input.lower():
+            logger.debug("Detected notice to vacate question - forcing tenancy mode")
+            # Add a hint to the query to help the model recognize this as a tenancy question
+            enhanced_query = f"[TENANCY QUESTION] {enhanced_query}"
+    
+    # Prepare initial state for the graph, one per image being processed in this request
+    initial_state = {
+        "query": enhanced_query,
+        "image_data": None,
+        "location": context_info["location"],
+        "response": None,
+        "sender": "user",
+        "chat_history": build_graph_history(st.session_state.messages)
+    }
+    
+    # Log initial state without the large data
+    if logger.isEnabledFor(logging.DEBUG):
         debug_state = {k: v for k, v in initial_state.items() if k not in ["image_data", "chat_history"]}
-        logger.debug(f"Initial state: {debug_state}")
-        
-        # Invoke the graph
-        try:
-            logger.debug("Invoking agent graph...")
-            response_state = compiled_graph.invoke(initial_state)
-            response = response_state["response"]
-            logger.debug(f"Response type: {type(response)}")
-            logger.debug(f"Response content: {response}")
-            
-            # Debug log full response state
+        logger.debug("Initial state: %s", debug_state)
+    
+    initial_states = [{**initial_state, "image_data": image} for image in images] or [initial_state]
+    
+    # Run the graph in the background; the result is collected below
+    st.session_state.pending_request = submit_graph_request(initial_states)
+
+# Collect the result of the in-flight request. This also runs on reruns triggered
+# while waiting, so interacting with the page never drops or repeats a request.
+if st.session_state.pending_request is not None:
+    # Deferred until a request is made so UI-only reruns skip the import
+    from schemas import PropertyIssueReport, TenancyFAQResponse
+    
+    # Wait for the graph. Only the graph run is guarded here: the future re-raises
+    # whatever failed on the graph loop, while Streamlit's rerun/stop signals and
+    # cancellation are BaseExceptions and pass through to resume on the next run.
+    try:
+        logger.debug("Waiting for agent graph...")
+        response_states = wait_for_graph(st.session_state.pending_request)
+    except Exception:
+        logger.exception("Graph request failed")
+        response_states = [{"response": GRAPH_ERROR_MESSAGE}]
+    
+    # Clear the request before storing, so a bug below can't leave it stuck pending
+    st.session_state.pending_request = None
+    
+    # One response per graph run, i.e. per uploaded image
+    for response_state in response_states:
+        response = response_state["response"]
+        logger.debug("Response type: %s", type(response))
+        logger.debug("Response content: %s", response)
+    
+        # Debug log full response state
+        if logger.isEnabledFor(logging.DEBUG):
             for key, value in response_state.items():
                 if key != "chat_history" and key != "image_data":  # Skip large data
-                    logger.debug(f"Response state - {key}: {value}")
-            
-            # Display the response
-            with st.chat_message("assistant", avatar="🏠"):
-                if isinstance(response, PropertyIssueReport):
-                    logger.debug("Rendering PropertyIssueReport")
-                    st.session_state.last_agent = "property_issue"
-                    st.markdown("### Property Issue Assessment")
-                    st.markdown(f'<div class="property-issue">{response.issue_assessment}</div>', unsafe_allow_html=True)
-                    
-                    if response.troubleshooting_suggestions:
-                        st.markdown("### Troubleshooting Suggestions")
-                        st.markdown('<div class="troubleshooting">', unsafe_allow_html=True)
-                        for i, suggestion in enumerate(response.troubleshooting_suggestions, 1):
-                            st.markdown(f"{i}. {suggestion}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    if response.professional_referral:
-                        st.markdown("### Professional Referrals")
-                        st.markdown('<div class="professional-referral">', unsafe_allow_html=True)
-                        for i, referral in enumerate(response.professional_referral, 1):
-                            st.markdown(f"{i}. {referral}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    if response.safety_warnings:
-                        st.markdown("### ⚠️ Safety Warnings")
-                        st.markdown('<div class="safety-warning">', unsafe_allow_html=True)
-                        for i, warning in enumerate(response.safety_warnings, 1):
-                            st.markdown(f"{i}. {warning}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Add to session state
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": "I've analyzed your property issue.", 
-                        "property_report": response
-                    })
-                
-                elif isinstance(response, TenancyFAQResponse):
-                    logger.debug("Rendering TenancyFAQResponse")
-                    st.session_state.last_agent = "tenancy_faq"
-                    st.markdown("### Answer")
-                    st.markdown(f'<div class="tenancy-answer">{response.answer}</div>', unsafe_allow_html=True)
-                    
-                    if response.legal_references and len(response.legal_references) > 0:
-                        st.markdown("### Legal References")
-                        st.markdown('<div class="legal-references">', unsafe_allow_html=True)
-                        for i, reference in enumerate(response.legal_references, 1):
-                            st.markdown(f"{i}. {reference}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    if response.regional_specifics:
-                        st.markdown("### Regional Information")
-                        st.markdown(f'<div class="regional-specifics">{response.regional_specifics}</div>', unsafe_allow_html=True)
-                    
-                    if response.additional_resources and len(response.additional_resources) > 0:
-                        st.markdown("### Additional Resources")
-                        st.markdown('<div class="resources">', unsafe_allow_html=True)
-                        for i, resource in enumerate(response.additional_resources, 1):
-                            st.markdown(f"{i}. {resource}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    st.markdown(f'<div class="disclaimer">{response.disclaimer}</div>', unsafe_allow_html=True)
-                    
-                    # Add to session state
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": "I've answered your tenancy question.", 
-                        "tenancy_response": response
-                    })
-                
-                else:
-                    logger.debug(f"Rendering plain text response: {response}")
-                    # Try to determine agent type from response content
-                    if any(word in str(response).lower() for word in ["property", "issue", "damage", "repair", "fix"]):
-                        st.session_state.last_agent = "property_issue"
-                    elif any(word in str(response).lower() for word in ["tenant", "landlord", "rent", "lease"]):
-                        st.session_state.last_agent = "tenancy_faq"
-                    else:
-                        # Keep the existing agent if we can't determine
-                        pass
-                        
-                    st.markdown(response)
-                    # Add to session state
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response
-                    })
-        
-        except Exception as e:
-            logger.error(f"Error processing request: {str(e)}", exc_info=True)
-            st.error(f"Error processing request: {str(e)}")
-            st.session_state.messages.append({
+                    logger.debug("Response state - %s: %s", key, value)
+    
+        # Add the response to session state as a plain dict; the rerun below renders it via the history loop
+        if isinstance(response, PropertyIssueReport):
+            logger.debug("Storing PropertyIssueReport")
+            st.session_state.last_agent = "property_issue"
+            append_message({
                 "role": "assistant", 
-                "content": f"I encountered an error: {str(e)}"
+                "content": "I've analyzed your property issue.", 
+                "property_report": response.model_dump(),
+                "rendered_html": render_property_report_html(response.model_dump_json())
             })
+    
+        elif isinstance(response, TenancyFAQResponse):
+            logger.debug("Storing TenancyFAQResponse")
+            st.session_state.last_agent = "tenancy_faq"
+            append_message({
+                "role": "assistant", 
+                "content": "I've answered your tenancy question.", 
+                "tenancy_response": response.model_dump(),
+                "rendered_html": render_tenancy_html(response.model_dump_json())
+            })
+    
+        else:
+            logger.debug("Storing plain text response: %s", response)
+            # Try to determine agent type from response content
+            if any(word in str(response).lower() for word in ["property", "issue", "damage", "repair", "fix"]):
+                st.session_state.last_agent = "property_issue"
+            elif any(word in str(response).lower() for word in ["tenant", "landlord", "rent", "lease"]):
+                st.session_state.last_agent = "tenancy_faq"
+            else:
+                # Keep the existing agent if we can't determine
+                pass
             
-        # After processing, set the image_processed flag if needed
-        if st.session_state.reset_image_processed:
-            st.session_state.image_processed = True
-            st.session_state.reset_image_processed = False
+            append_message({
+                "role": "assistant", 
+                "content": response
+            })
+
+    save_messages()
+    
+    # After processing, set the image_processed flag if needed
+    if st.session_state.reset_image_processed:
+        st.session_state.image_processed = True
+        st.session_state.reset_image_processed = False
     
     # Re-enable chat input after processing
     st.session_state.is_chat_input_disabled = False
+    
+    # Rerun so every message, including this turn, is drawn once by the history loop
+    st.rerun()
 
 # Footer with attribution
 st.markdown("---")
-st.markdown('<div class="footer">', unsafe_allow_html=True)
-st.markdown("**PropertyLoop Assignment by Harsh Dayal**")
-st.markdown("Email: harshdayal13@gmail.com")
-st.markdown(f"© {datetime.datetime.now().year} PropertyLoop Assistant powered by Langchain, LangGraph, and Google Gemini")
-st.markdown('</div>', unsafe_allow_html=True)
+st.markdown(
+    '<div class="footer">\n\n'
+    "**PropertyLoop Assignment by Harsh Dayal**\n\n"
+    "Email: harshdayal13@gmail.com\n\n"
+    f"© {_CURRENT_YEAR} PropertyLoop Assistant powered by Langchain, LangGraph, and Google Gemini\n\n"
+    "</div>",
+    unsafe_allow_html=True
+)
@@ -2,7 +2,10 @@
 Configuration module for the Real Estate Chatbot.
 Loads environment variables and provides configuration functions.
 """
+import asyncio
 import os
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_community.utilities import GoogleSearchAPIWrapper
@@ -10,10 +13,28 @@ from langchain_community.utilities import GoogleSearchAPIWrapper
 # Load environment variables from .env file
 load_dotenv()
 
+@lru_cache(maxsize=None)
+def get_event_loop():
+    """
+    Returns the event loop every async Gemini call must run on.
+    
+    ChatGoogleGenerativeAI builds its async gRPC client on the first loop it is
+    awaited from, and the clients below are cached per process, so all ainvoke
+    calls have to share one loop. It is cached here, next to the clients, and
+    runs forever on a daemon thread.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="gemini-loop", daemon=True).start()
+    return loop
+
+@lru_cache(maxsize=None)
 def get_gemini_flash_llm():
     """
     Returns a configured ChatGoogleGenerativeAI instance using the gemini-1.5-flash model.
     Used primarily for image analysis and routing.
+    
+    The client is created once per process and reused, so its underlying
+    connection survives Streamlit reruns instead of being rebuilt per request.
     """
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -26,10 +47,13 @@ def get_gemini_flash_llm():
         convert_system_message_to_human=True
     )
 
+@lru_cache(maxsize=None)
 def get_gemini_pro_llm():
     """
     Returns a configured ChatGoogleGenerativeAI instance using the gemini-1.5-pro model.
     Used primarily for text-based analysis and responses.
+    
+    Cached like get_gemini_flash_llm().
     """
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
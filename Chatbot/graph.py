@@ -2,7 +2,7 @@
 LangGraph implementation for the real estate chatbot.
 Defines the state, nodes, and edges for the agent workflow.
 """
-from typing import Dict, List, Any, TypedDict, Optional, Annotated, Literal
+from typing import Dict, List, Any, Optional
 from typing_extensions import TypedDict
 
 from langgraph.graph import StateGraph, END
@@ -56,6 +56,3 @@ def create_graph():
     
     # Compile the graph
     return graph.compile()
-
-# Create compiled graph instance
-compiled_graph = create_graph()
@@ -19,7 +19,7 @@ class PropertyIssueReport(BaseModel):
     )
     safety_warnings: List[str] = Field(
         description="Urgent safety warnings for potential hazards detected.",
-        default=[]
+        default_factory=list
     )
 
 class TenancyFAQResponse(BaseModel):
@@ -31,7 +31,7 @@ class TenancyFAQResponse(BaseModel):
     )
     legal_references: List[str] = Field(
         description="Relevant laws, regulations, or legal principles referenced.",
-        default=[]
+        default_factory=list
     )
     regional_specifics: Optional[str] = Field(
         description="Location-specific information if a location was provided.",
@@ -43,5 +43,5 @@ class TenancyFAQResponse(BaseModel):
     )
     additional_resources: List[str] = Field(
         description="Additional resources or organizations the user can contact for more help.",
-        default=[]
+        default_factory=list
     )
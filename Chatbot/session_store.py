@@ -0,0 +1,158 @@
+"""
+Disk persistence for chat sessions.
+Stores each session's messages as JSON so a page refresh can restore the
+conversation. Uploaded images are written here as soon as they are sent and
+messages refer to them by key, so session state never holds image bytes.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Holds a <session_id>.json file, a <session_id>.archive.jsonl file and a
+# <session_id>/ image directory per session
+SESSIONS_DIR = Path(__file__).parent / "data" / "sessions"
+
+# Sessions not written or loaded for this long are removed by cleanup_idle_sessions()
+SESSION_IDLE_TTL_SECONDS = 24 * 60 * 60
+
+_SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+def new_session_id():
+    """
+    Returns a fresh random session id.
+    """
+    return uuid.uuid4().hex
+
+def is_valid_session_id(session_id):
+    """
+    Checks that a session id has the form new_session_id() produces.
+    Session ids arrive in the URL, so anything else is rejected before it reaches a path.
+    """
+    return isinstance(session_id, str) and _SESSION_ID_RE.fullmatch(session_id) is not None
+
+def _session_file(session_id):
+    return SESSIONS_DIR / f"{session_id}.json"
+
+def _archive_file(session_id):
+    return SESSIONS_DIR / f"{session_id}.archive.jsonl"
+
+def _image_dir(session_id):
+    return SESSIONS_DIR / session_id
+
+def store_image(session_id, image_bytes):
+    """
+    Writes an image for a session under a content-derived key, skipping images already on disk.
+    
+    Args:
+        session_id: The id of the session
+        image_bytes: The JPEG bytes of the image
+    
+    Returns:
+        str: The key to read the image back with load_image()
+    """
+    image_key = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    image_dir = _image_dir(session_id)
+    path = image_dir / f"{image_key}.jpg"
+    if not path.exists():
+        image_dir.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(image_bytes)
+    return image_key
+
+def load_image(session_id, image_key):
+    """
+    Reads back an image written by store_image().
+    """
+    return (_image_dir(session_id) / f"{image_key}.jpg").read_bytes()
+
+def save_session(session_id, messages):
+    """
+    Writes a session's messages to disk.
+    The caller caps the history (app.MAX_SESSION_MESSAGES); older messages are archived.
+    
+    Args:
+        session_id: The id of the session
+        messages: The chat messages kept in session state
+    """
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    session_file = _session_file(session_id)
+    tmp_file = session_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(messages), encoding="utf-8")
+    os.replace(tmp_file, session_file)
+
+def archive_messages(session_id, messages):
+    """
+    Appends messages evicted from a session's in-memory history to its archive file.
+    
+    Args:
+        session_id: The id of the session
+        messages: The oldest chat messages, in order
+    """
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    with _archive_file(session_id).open("a", encoding="utf-8") as archive:
+        archive.writelines(json.dumps(message) + "\n" for message in messages)
+
+def load_session(session_id):
+    """
+    Reads a session's messages back from disk.
+    
+    Args:
+        session_id: The id of the session
+    
+    Returns:
+        list: The stored messages, or an empty list if there are none or they can't be read
+    """
+    session_file = _session_file(session_id)
+    if not session_file.exists():
+        return []
+    
+    try:
+        messages = json.loads(session_file.read_text(encoding="utf-8"))
+        
+        # Loading counts as activity for the idle cleanup
+        session_file.touch()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not restore session {session_id}: {str(e)}")
+        return []
+    
+    return messages
+
+def delete_session(session_id):
+    """
+    Removes a session's messages, archive and images from disk.
+    """
+    _session_file(session_id).unlink(missing_ok=True)
+    _archive_file(session_id).unlink(missing_ok=True)
+    shutil.rmtree(_image_dir(session_id), ignore_errors=True)
+
+def cleanup_idle_sessions(max_idle=SESSION_IDLE_TTL_SECONDS):
+    """
+    Deletes every session that has not been written or loaded for max_idle seconds.
+    Image directories whose session was never saved are aged by their own mtime.
+    
+    Returns:
+        int: The number of sessions deleted
+    """
+    if not SESSIONS_DIR.exists():
+        return 0
+    
+    session_ids = {path.stem for path in SESSIONS_DIR.glob("*.json")}
+    session_ids.update(path.name for path in SESSIONS_DIR.iterdir() if path.is_dir())
+    
+    cutoff = time.time() - max_idle
+    deleted = 0
+    for session_id in session_ids:
+        session_file = _session_file(session_id)
+        last_active = session_file if session_file.exists() else _image_dir(session_id)
+        if last_active.stat().st_mtime < cutoff:
+            delete_session(session_id)
+            deleted += 1
+    
+    return deleted